@@ -1,8 +1,207 @@
+import functools
+import hashlib
+import itertools
 import logging as log
+import os
+import re
+import socket
+import struct
+import tempfile
+import threading
+import time
+import weakref
+from urllib.parse import quote, urlencode
+
+# Drivers des db, seul celui du type de db utilisé est importé, au premier usage (voir _import_driver)
+psycopg2 = psycopg = psycopg_pool = pgcopy = mariadb = mysql = pyodbc = sqlite3 = None
+
+@functools.lru_cache(maxsize=None)
+def _import_driver(db_type, use_pipeline=False):
+	""" Importe le driver d'un type de db, une seule fois par type, et renvoie son module """
+	global psycopg2, psycopg, psycopg_pool, pgcopy, mariadb, mysql, pyodbc, sqlite3
+	if db_type == 'postgresql' and use_pipeline:
+		import psycopg # Installer avec 'pip install psycopg psycopg-pool'
+		import psycopg.rows
+		import psycopg.sql
+		import psycopg_pool
+		return psycopg
+	elif db_type == 'postgresql':
+		import psycopg2
+		import psycopg2.extras
+		import psycopg2.pool
+		try:
+			import pgcopy # Optionnel, copie binaire pour bulk_copy, installer avec 'pip install pgcopy'
+		except ImportError:
+			pass
+		return psycopg2
+	elif db_type == 'mariadb':
+		import mariadb # Installer avec 'pip install mariadb'. Il y aura peut-�tre besoin de certaines d�pendances 'sudo apt-get install libmariadb3 libmariadb-dev'
+		return mariadb
+	elif db_type == 'mysql':
+		import mysql.connector
+		import mysql.connector.pooling
+		return mysql.connector
+	elif db_type == 'sqlserver':
+		import pyodbc
+		# Pooling des connexions par le gestionnaire ODBC, à activer avant la première connexion
+		pyodbc.pooling = True
+		return pyodbc
+	elif db_type == 'sqlite':
+		import sqlite3 # Installer avec 'pip install db-sqlite3'
+		return sqlite3
+
+# Valeurs par défaut de la config en fonction du type de db
+_DEFAULTS = {
+	"postgresql": {"port": 5432, "user": "postgres", "sslmode": "allow", "options": "", "pool_max_size": 20},
+	"mariadb": {"port": 3306, "sslmode": "allow", "options": "", "pool_max_size": 10},
+	"mysql": {"port": 3306, "sslmode": "allow", "options": "", "pool_max_size": 10},
+	"sqlserver": {"port": "", "sslmode": "allow", "options": ""},
+	"sqlite": {"host": "", "port": "", "user": "", "password": "", "sslmode": "", "options": ""},
+}
+
+# Éléments obligatoires de la config et message d'erreur s'ils manquent
+_REQUIRED = (
+	("database", "Le nom de la base de données n'a pas été spécifié"),
+	("host", "L'adresse de la base de données n'a pas été spécifiée"),
+	("port", "Le port de la base de données n'a pas été spécifié"),
+	("user", "L'utilisateur de la base de données n'a pas été spécifié"),
+	("sslmode", "Le mode de ssl de la base de données n'a pas été spécifié"),
+	("options", "Les options de la base de données n'ont pas été spécifiées"),
+)
+
+# Format des DATETIMEOFFSET renvoyés par pyodbc, compilé une seule fois
+_DTO = struct.Struct("<6hI2h")
+
+# Groupe de paramètres d'une ligne dans "VALUES (%s, %s, ...)", pour construire le template de execute_values
+_VALUES_ROW = re.compile(r"VALUES\s*(\((?:[^()]|\([^()]*\))*%s(?:[^()]|\([^()]*\))*\))", re.IGNORECASE)
+# Requête déjà écrite pour execute_values (VALUES %s)
+_VALUES_SINGLE = re.compile(r"\bVALUES\s*%s", re.IGNORECASE)
+# Début d'une requête de lecture, un WITH pouvant aussi contenir des modifications (WITH ... DELETE ... RETURNING)
+_READ_PREFIX = re.compile(r"^[\s(]*(SELECT|SHOW|WITH)\b", re.IGNORECASE)
+# Modification de données dans un WITH (WITH d AS (...) DELETE ...)
+_MODIFYING = re.compile(r"\b(?:INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+# Clause RETURNING, cherchée par le moteur de regex sans copier la requête en majuscules
+_RETURNING = re.compile(r"\bRETURNING\b", re.IGNORECASE)
+# Limitation du nombre de lignes déjà présente dans la requête
+# (LIMIT ou TOP suivi d'un nombre, d'un paramètre %s, ? ou @n, de ALL, ...)
+_HAS_LIMIT = re.compile(r"\bLIMIT\b|\bFETCH\s+(?:FIRST|NEXT)\b|\bTOP\b", re.IGNORECASE)
+# Clause de verrouillage, après laquelle un LIMIT ajouté en fin de requête est refusé par mariadb et mysql
+_LOCKING = re.compile(r"\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE|KEY\s+SHARE)\b|\bLOCK\s+IN\s+SHARE\s+MODE\b", re.IGNORECASE)
+# Commentaire en fin de requête, qui contiendrait le LIMIT ajouté
+_TRAILING_COMMENT = re.compile(r"(?:--|#)[^\n]*$|\*/\s*;?\s*$")
+# Premier SELECT d'une requête sqlserver, après lequel TOP est ajouté (après DISTINCT ou ALL s'il y en a un)
+_SELECT_HEAD = re.compile(r"^([\s(]*SELECT(?:\s+(?:DISTINCT|ALL))?)\b", re.IGNORECASE)
+# Combinaison de plusieurs SELECT, où TOP ne s'appliquerait qu'au premier
+_SET_OPERATOR = re.compile(r"\b(?:UNION|EXCEPT|INTERSECT)\b", re.IGNORECASE)
+# Pagination sqlserver (OFFSET ... ROWS), qui ne peut pas être combinée avec TOP
+_OFFSET = re.compile(r"\bOFFSET\b", re.IGNORECASE)
+# Paramètres vides passés à sqlite quand la requête n'en a pas
+_EMPTY = ()
+
+def _csv_field(value, null):
+	""" Valeur d'un champ CSV pour le chargement en masse, les None donnent le marqueur null sans guillemets """
+	if value is None:
+		return null
+	if isinstance(value, bool):
+		value = int(value)
+	return '"' + str(value).replace('"', '""') + '"'
+
+def _query_kind(query):
+	""" Analyse une requête et renvoie (commit, returning, select)
+		- commit : la requête peut modifier la db (tout sauf SELECT et SHOW, un WITH peut contenir un DELETE, ...)
+		- returning : la requête modifie la db et renvoie des données (utile avant l'exécution, par exemple pour executemany)
+		- select : la requête est un SELECT (ou un WITH sans INSERT, UPDATE, DELETE ni MERGE), à laquelle une limite 
+			peut être ajoutée et qui peut être lue par un curseur côté serveur
+		Le fait qu'une requête renvoie des données est ensuite déterminé par le curseur (cursor.description)
+		Le résultat est gardé en cache pour les requêtes courtes, qui sont celles répétées le plus souvent
+	"""
+	if len(query) > 4096:
+		return _query_kind_uncached(query)
+	return _query_kind_cached(query)
+
+def _query_kind_uncached(query):
+	""" Analyse d'une requête, voir _query_kind """
+	read = _READ_PREFIX.match(query)
+	if read is None:
+		return True, _RETURNING.search(query) is not None, False
+	keyword = read.group(1).upper()
+	if keyword == "WITH":
+		return True, _RETURNING.search(query) is not None, _MODIFYING.search(query) is None
+	return False, False, keyword == "SELECT"
+
+_query_kind_cached = functools.lru_cache(maxsize=512)(_query_kind_uncached)
+
+@functools.lru_cache(maxsize=512)
+def _with_limit(query, n, db_type):
+	""" Ajoute une limite de n lignes à un SELECT qui n'en a pas encore, LIMIT n en fin de requête ou TOP n pour sqlserver 
+		La requête est renvoyée telle quelle si elle a déjà une limite ou si elle ne peut pas être modifiée sans risque
+	"""
+	if _HAS_LIMIT.search(query) is not None:
+		return query
+	if db_type == "sqlserver":
+		# Avec UNION, ... TOP ne limiterait que le premier SELECT, et sqlserver refuse TOP avec OFFSET
+		if _SET_OPERATOR.search(query) is not None or _OFFSET.search(query) is not None:
+			return query
+		# Dans un WITH, TOP devrait être ajouté au SELECT final, la requête n'est pas modifiée
+		return _SELECT_HEAD.sub(r"\1 TOP " + str(int(n)), query, count=1)
+	if _LOCKING.search(query) is not None or _TRAILING_COMMENT.search(query) is not None:
+		return query
+	return query.rstrip(" ;\t\r\n") + " LIMIT " + str(int(n))
+
+def _odbc_value(value):
+	""" Valeur d'une chaîne de connexion ODBC entre accolades, pour qu'un ; ou un = (dans un mot de passe, ...) 
+		ne puisse pas être lu comme un autre attribut
+	"""
+	return "{" + str(value).replace("}", "}}") + "}"
+
+# Paramètre (%s) ou pourcent échappé (%%) d'une requête psycopg2
+_PG_PARAM = re.compile(r"%%|%s")
+
+@functools.lru_cache(maxsize=512)
+def _pg_numbered(query):
+	""" Remplace les %s d'une requête psycopg2 par les $1, $2, ... natifs de postgresql, renvoie la requête et le nombre de paramètres """
+	count = 0
+	def placeholder(match):
+		nonlocal count
+		if match.group(0) == "%%":
+			return "%"
+		count += 1
+		return "$" + str(count)
+	return _PG_PARAM.sub(placeholder, query), count
+
+@functools.lru_cache(maxsize=512)
+def _pg_prepared(query):
+	""" Renvoie le nom, la requête PREPARE et la requête EXECUTE correspondant à une requête psycopg2
+		Les paramètres sont passés à EXECUTE, le résultat est gardé en cache
+	"""
+	numbered, count = _pg_numbered(query)
+	name = "dbu_" + hashlib.sha1(query.encode()).hexdigest()[:16]
+	prepare = "PREPARE " + name + " AS " + numbered
+	execute = "EXECUTE " + name + (" (" + ", ".join(["%s"] * count) + ")" if count else "")
+	return name, prepare, execute
+
+@functools.lru_cache(maxsize=512)
+def _sqlite_rewrite(query):
+	""" Remplace les %s par les ? de sqlite (et turbodbc), le résultat est gardé en cache pour les requêtes répétées """
+	return query.replace("%s", "?")
+
 class db_unified:
 	""" Classe pour la gestion de la DB """
 
-	def __init__(self, db_type = None, db_name=None, db_server=None, db_port=None, db_user=None, db_password = None, sslmode=None, options = None, config=None):
+	# Pools de connexions partagés par toutes les instances, indexés par (type, pipeline, tailles du pool, paramètres de connexion)
+	_pools = {}
+	_pools_lock = threading.Lock()
+	# Numéros des noms de pools mariadb et mysql, qui doivent être uniques
+	_pool_ids = itertools.count()
+	# Une condition par clé de pool : verrou de création du pool (les autres pools ne sont pas bloqués) 
+	# et signal des connexions rendues au pool, pour réveiller les threads qui attendent une connexion libre
+	_pool_conditions = {}
+	# Requêtes préparées par psycopg2 sur chaque connexion (nom: vrai si préparée, faux si la préparation a échoué),
+	# elles restent valables tant que la connexion est ouverte
+	_prepared = weakref.WeakKeyDictionary()
+
+	def __init__(self, db_type = None, db_name=None, db_server=None, db_port=None, db_user=None, db_password = None, sslmode=None, options = None, config=None, 
+		connect_timeout=None, use_pipeline=None, pool_min_size=None, pool_max_size=None, pool_timeout=None):
 		""" db_type : type de db, valeurs possibles : 
 				- postgresql
 				- mariadb
@@ -12,6 +211,14 @@ class db_unified:
 
 			sslmode | valeurs possibles: disable, allow, prefer, require, verify-ca, verify-full 
 			options peut servir à chercher dans un schéma particulier : options="-c search_path=dbo,public")
+			connect_timeout : délai maximum (en secondes) pour établir la connexion, 10 par défaut
+			use_pipeline : avec postgresql, utilise psycopg (v3) au lieu de psycopg2, ce qui permet d'envoyer 
+				plusieurs requêtes sans attendre la réponse de chacune (voir exec_pipeline)
+				Installer avec 'pip install psycopg psycopg-pool'
+			pool_min_size : nombre de connexions ouvertes à la création du pool (postgresql), 2 par défaut
+			pool_max_size : nombre maximum de connexions du pool, 20 par défaut pour postgresql et 10 pour mariadb et mysql
+				(mariadb et mysql ouvrent toutes les connexions à la création du pool)
+			pool_timeout : délai maximum (en secondes) d'attente d'une connexion libre dans le pool, 30 par défaut
 			config: Premet de passer toute la config via un dictionnaire. Les clés sont:
 				- type
 				- name
@@ -19,6 +226,13 @@ class db_unified:
     			- port
     			- user
     			- passwd
+    			- connect_timeout
+    			- use_pipeline
+    			- pool_min_size
+    			- pool_max_size
+    			- pool_timeout
+    			- local_infile (mariadb et mysql, autorise LOAD DATA LOCAL INFILE pour bulk_copy, désactivé par défaut
+    				car le serveur peut alors lire les fichiers du client)
     		Une config passée en paramètre écrase les valeurs par défaut du type de base de donnée
     		Un paramètre passé en paramètre en plus d'une config écrase le paramètre correspondant de la config
 
@@ -32,6 +246,15 @@ class db_unified:
 		self.password = None
 		self.sslmode = None
 		self.options = None
+		self.ssl_key = None
+		self.ssl_cert = None
+		self.ssl_verify_cert = False
+		self.connect_timeout = 10
+		self.use_pipeline = False
+		self.local_infile = False
+		self.pool_min_size = 2
+		self.pool_max_size = None
+		self.pool_timeout = 30
 
 		# On vérifie que le type de db a été spécifié (en paramètre ou dans la config)
 		if db_type is None and (config is not None and config.get("type") is None):
@@ -39,55 +262,29 @@ class db_unified:
 
 		# On sauve le type de db
 		self.db_type = db_type if db_type is not None else config.get("type")
+		if self.db_type not in _DEFAULTS:
+			raise ValueError(f"Type de base de données inconnu : {self.db_type}")
+		if config is not None:
+			self.use_pipeline = config.get("use_pipeline", self.use_pipeline)
+		if use_pipeline is not None: self.use_pipeline = use_pipeline
 
-		# Import des bibliothèques en fonction du type de db choisi
+		# Import du driver du type de db choisi, les autres ne sont pas chargés
+		self._drv = _import_driver(self.db_type, bool(self.use_pipeline))
+		if self.db_type == 'mysql':
+			self._connect_errors = (self._drv.InterfaceError, self._drv.DatabaseError)
+		else:
+			self._connect_errors = (self._drv.OperationalError, )
 		if self.db_type == 'postgresql':
-			global psycopg2
-			import psycopg2
-			self.psycopg2_errors = psycopg2.errors
-			import psycopg2.extras
-			global platform
-			import platform
-		elif self.db_type == 'mariadb':
-			global mariadb
-			import mariadb # Installer avec 'pip install mariadb'. Il y aura peut-�tre besoin de certaines d�pendances 'sudo apt-get install libmariadb3 libmariadb-dev'
-		elif self.db_type == 'mysql':
-			global mysql
-			import mysql.connector
-		elif self.db_type == 'sqlserver':
-			global pyodbc
-			import pyodbc
-			global struct
-			import struct
-		elif self.db_type == 'sqlite':
-			global sqlite3
-			import sqlite3 # Installer avec 'pip install db-sqlite3'
+			# Avec psycopg (v3), mêmes noms d'exceptions que dans psycopg2.errors
+			self.psycopg2_errors = self._drv.errors
+			if not self.use_pipeline:
+				self._pool_errors = (psycopg2.pool.PoolError, )
+		elif self.db_type in ('mariadb', 'mysql'):
+			self._pool_errors = (self._drv.PoolError, )
 
 		# Attribution des valeurs par défaut en fonction du type de db
-		if self.db_type == "postgresql":
-			self.port = 5432
-			self.user = "postgres"
-			self.sslmode = "allow"
-			self.options = ""
-		elif self.db_type == "mariadb":
-			self.port = 3306
-			self.sslmode = "allow"
-			self.options = ""
-		elif self.db_type == "mysql":
-			self.port = 3306
-			self.sslmode = "allow"
-			self.options = ""
-		elif self.db_type == "sqlserver":
-			self.port = ""
-			self.sslmode = "allow"
-			self.options = ""
-		elif self.db_type == "sqlite":
-			self.host = ""
-			self.port = ""
-			self.user = ""
-			self.password = ""
-			self.sslmode = ""
-			self.options = ""
+		for key, value in _DEFAULTS[self.db_type].items():
+			setattr(self, key, value)
 
 		# On récupère les éléments de la config s'ils existent
 		if config is not None:
@@ -97,10 +294,15 @@ class db_unified:
 			self.user = config.get("user", self.user)
 			self.password = config.get("passwd", self.password)
 			self.sslmode = config.get("sslmode", self.sslmode)
-			self.ssl_key = config.get("ssl_key")
-			self.ssl_cert = config.get("ssl_cert")
-			self.ssl_verify_cert = config.get("ssl_verify_cert", False)
+			self.ssl_key = config.get("ssl_key", self.ssl_key)
+			self.ssl_cert = config.get("ssl_cert", self.ssl_cert)
+			self.ssl_verify_cert = config.get("ssl_verify_cert", self.ssl_verify_cert)
 			self.options = config.get("options", self.options)
+			self.connect_timeout = config.get("connect_timeout", self.connect_timeout)
+			self.local_infile = config.get("local_infile", self.local_infile)
+			self.pool_min_size = config.get("pool_min_size", self.pool_min_size)
+			self.pool_max_size = config.get("pool_max_size", self.pool_max_size)
+			self.pool_timeout = config.get("pool_timeout", self.pool_timeout)
 
 		# On récupère les paramètres s'ils ont été spécifiés
 		if db_name is not None : self.database = db_name 
@@ -110,109 +312,493 @@ class db_unified:
 		if db_password is not None: self.password = db_password
 		if sslmode is not None: self.sslmode = sslmode
 		if options is not None: self.options = options
+		if connect_timeout is not None: self.connect_timeout = connect_timeout
+		if pool_min_size is not None: self.pool_min_size = pool_min_size
+		if pool_max_size is not None: self.pool_max_size = pool_max_size
+		if pool_timeout is not None: self.pool_timeout = pool_timeout
 
 		# On vérifie que la config est complète
-		if self.database is None: raise ValueError("Le nom de la base de données n'a pas été spécifié")
-		if self.host is None: raise ValueError("L'adresse de la base de données n'a pas été spécifiée")
-		if self.port is None: raise ValueError("Le port de la base de données n'a pas été spécifié")
-		if self.user is None: raise ValueError("L'utilisateur de la base de données n'a pas été spécifié")
-		if self.password is None: self.passwd = ""
-		if self.sslmode is None: raise ValueError("Le mode de ssl de la base de données n'a pas été spécifié")
-		if self.options is None: raise ValueError("Les options de la base de données n'ont pas été spécifiées")
+		for key, message in _REQUIRED:
+			if getattr(self, key) is None: raise ValueError(message)
+		if self.password is None: self.password = ""
 
 		# On crée les objets nécessaires pour plus tard
-		self.db = None
-		self.cursor = None
+		# La connexion et les curseurs sont propres à chaque thread (voir les propriétés db, cursor et _cursors),
+		# une même instance peut donc être utilisée par plusieurs threads, chacun avec sa connexion du pool
+		self._local = threading.local()
+		# Fonctions d'exécution et de lecture de exec(), par combinaison (fetch, fetch_type, insert_many)
+		self._exec_cache = {}
+		# Pour sqlserver, le driver et la chaîne de connexion ne changent pas, on les calcule une seule fois
+		if self.db_type == "sqlserver":
+			# Le premier driver trouvé sera utilisé
+			self._odbc_driver = pyodbc.drivers()[0]
+			server = f"{self.host},{self.port}" if self.port != "" else self.host
+			self._odbc_dsn = f"DRIVER={_odbc_value(self._odbc_driver)};SERVER={_odbc_value(server)};DATABASE={_odbc_value(self.database)};" \
+				f"UID={_odbc_value(self.user)};PWD={_odbc_value(self.password)};TrustServerCertificate=YES;"
+		# Paramètres de connexion passés au pool, calculés une seule fois
+		self._connect_kwargs = {}
+		if self.db_type == "postgresql":
+			# libpq désactive déjà Nagle (TCP_NODELAY), on active les keepalives pour détecter les connexions mortes du pool
+			self._connect_kwargs = dict(host=self.host, port=self.port, dbname=self.database, user=self.user, password=self.password, 
+				sslmode=self.sslmode, options=self.options, connect_timeout=self.connect_timeout, 
+				keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+		elif self.db_type == "mariadb":
+			# Le connecteur mariadb n'accepte qu'un port de type int
+			self._connect_kwargs = dict(host=self.host, port=int(self.port), database=self.database, user=self.user, password=self.password, 
+				ssl_key=self.ssl_key, ssl_cert=self.ssl_cert, ssl_verify_cert=self.ssl_verify_cert, 
+				connect_timeout=self.connect_timeout, local_infile=self.local_infile)
+		elif self.db_type == "mysql":
+			# L'extension C (libmysqlclient) active TCP_NODELAY sur le socket, on la préfère à l'implémentation pure python
+			self._connect_kwargs = dict(host=self.host, port=int(self.port), database=self.database, user=self.user, password=self.password, 
+				connection_timeout=self.connect_timeout, use_pure=False, allow_local_infile=self.local_infile)
+		# Clé du pool de connexions, partagé par les instances qui ont exactement les mêmes paramètres de connexion
+		# (un autre mot de passe ou d'autres options ne doivent pas réutiliser les connexions d'un pool existant)
+		self._pool_key = (self.db_type, self.use_pipeline, self.pool_min_size, self.pool_max_size) + tuple(sorted(self._connect_kwargs.items()))
+
+	@property
+	def db(self):
+		""" Connexion du thread en cours """
+		return getattr(self._local, "db", None)
+
+	@db.setter
+	def db(self, value):
+		self._local.db = value
+
+	@property
+	def cursor(self):
+		""" Curseur du thread en cours """
+		return getattr(self._local, "cursor", None)
+
+	@cursor.setter
+	def cursor(self, value):
+		self._local.cursor = value
+
+	@property
+	def _cursors(self):
+		""" Curseurs gardés ouverts sur la connexion du thread en cours, un par fetch_type """
+		cursors = getattr(self._local, "cursors", None)
+		if cursors is None:
+			cursors = self._local.cursors = {}
+		return cursors
+
+	def _get_pool(self):
+		""" Renvoie le pool de connexions correspondant à la config, il est créé à la première utilisation """
+		pool = db_unified._pools.get(self._pool_key)
+		if pool is not None:
+			return pool
+		# Le pool est créé (et ses premières connexions ouvertes) sous le verrou de sa clé uniquement,
+		# un seul thread le crée et les autres db ne sont pas bloquées
+		with self._pool_condition():
+			pool = db_unified._pools.get(self._pool_key)
+			if pool is None:
+				pool = self._create_pool()
+				with db_unified._pools_lock:
+					db_unified._pools[self._pool_key] = pool
+		return pool
+
+	def _pool_condition(self):
+		""" Renvoie la condition associée à la clé du pool de l'instance """
+		condition = db_unified._pool_conditions.get(self._pool_key)
+		if condition is None:
+			with db_unified._pools_lock:
+				condition = db_unified._pool_conditions.setdefault(self._pool_key, threading.Condition())
+		return condition
+
+	def _create_pool(self):
+		""" Crée un pool de connexions avec les paramètres de l'instance """
+		pool_name = "db_unified_" + str(next(db_unified._pool_ids))
+		if self.db_type == "postgresql" and self.use_pipeline:
+			return psycopg_pool.ConnectionPool(min_size=self.pool_min_size, max_size=self.pool_max_size, open=True, kwargs=self._connect_kwargs)
+		elif self.db_type == "postgresql":
+			return psycopg2.pool.ThreadedConnectionPool(minconn=self.pool_min_size, maxconn=self.pool_max_size, **self._connect_kwargs)
+		elif self.db_type == "mariadb":
+			return mariadb.ConnectionPool(pool_name=pool_name, pool_size=self.pool_max_size, **self._connect_kwargs)
+		elif self.db_type == "mysql":
+			return mysql.connector.pooling.MySQLConnectionPool(pool_name=pool_name, pool_size=self.pool_max_size, **self._connect_kwargs)
+
+	@staticmethod
+	def _close_pool(db_type, use_pipeline, pool):
+		""" Ferme les connexions d'un pool """
+		if db_type == "postgresql" and not use_pipeline:
+			pool.closeall()
+		elif db_type in ("postgresql", "mariadb"):
+			pool.close()
+		# mysql.connector n'a pas de méthode publique pour fermer un pool, 
+		# ses connexions sont fermées quand il n'est plus référencé
+
+	def _acquire(self):
+		""" Prend une connexion dans le pool, en attendant au plus pool_timeout secondes qu'une connexion se libère """
+		pool = self._get_pool()
+		if self.db_type == "postgresql" and self.use_pipeline:
+			# psycopg_pool gère lui-même l'attente
+			return pool.getconn(timeout=self.pool_timeout)
+		# Les autres pools renvoient une erreur (ou None pour mariadb) dès qu'ils sont vides,
+		# on attend alors qu'une connexion soit rendue (disconnect), avec un délai croissant par sécurité
+		deadline = time.monotonic() + self.pool_timeout
+		delay = 0.005
+		condition = self._pool_condition()
+		while True:
+			try:
+				db = pool.getconn() if self.db_type == "postgresql" else pool.get_connection()
+			except self._pool_errors:
+				db = None
+			remaining = deadline - time.monotonic()
+			if db is not None or remaining <= 0:
+				break
+			with condition:
+				condition.wait(min(delay, remaining))
+			delay = min(delay * 2, 0.5)
+		if db is None:
+			log.error("Aucune connexion disponible dans le pool après " + str(self.pool_timeout) + " secondes")
+		return db
+
+	@classmethod
+	def close_pools(cls):
+		""" Ferme toutes les connexions des pools (par exemple à l'arrêt de l'application) """
+		with cls._pools_lock:
+			pools = list(cls._pools.items())
+			cls._pools.clear()
+		for key, pool in pools:
+			cls._close_pool(key[0], key[1], pool)
 
 	def connect(self):
 		""" Méthode pour se connecter à la base de données
-			On commence par pinguer la db
+			La connexion est prise dans le pool partagé (postgresql, mariadb, mysql)
+			Si une connexion est déjà tenue par l'instance, elle est réutilisée
 		"""
-		# Si le ping est passé on essaie de se connecter à la db
-		if self.db_type == "postgresql":
-			self.db = psycopg2.connect(host=self.host, port=self.port, database=self.database, user=self.user, password=self.password, 
-				sslmode = self.sslmode, options = self.options)
-		elif self.db_type == "mariadb":
-			self.db = mariadb.connect(host=self.host, port=self.port, database=self.database, user=self.user, password=self.password, 
-				ssl_key=self.ssl_key, ssl_cert=self.ssl_cert, ssl_verify_cert=self.ssl_verify_cert)
-		elif self.db_type == "mysql":
-			self.db = mysql.connector.connect(host = self.host, database = self.database, user = self.user, password = self.password)
-		elif self.db_type == "sqlserver":
-			# Le premier driver trouvé sera utilisé
-			driver = pyodbc.drivers()[0]
-			self.db = pyodbc.connect("DRIVER={" + driver + "};SERVER=" + self.host + "," + self.port + ";DATABASE=" + self.database + ";UID=" + self.user \
-				+ ";PWD=" + self.password + ";TrustServerCertificate=YES;" )
-		elif self.db_type == 'sqlite':
-			self.db = sqlite3.connect(self.database)
+		if self.db is not None:
+			# Une connexion postgresql coupée est rendue au pool (qui l'écarte) et remplacée
+			if self.db_type == "postgresql" and self.db.closed:
+				self.disconnect()
+			else:
+				return True
+		# Une db injoignable est détectée par le délai de connexion du driver
+		try:
+			if self.db_type in ("postgresql", "mariadb", "mysql"):
+				self.db = self._acquire()
+			elif self.db_type == "sqlserver":
+				self.db = self._drv.connect(self._odbc_dsn, timeout=self.connect_timeout)
+				# Conversion des DATETIMEOFFSET (type ODBC -155) que pyodbc ne sait pas lire
+				self.db.add_output_converter(-155, self.handle_datetimeoffset)
+			elif self.db_type == 'sqlite':
+				self.db = self._drv.connect(self.database)
+		except self._connect_errors as error:
+			log.error("Impossible de se connecter à la base de données : " + str(error))
+			self.db = None
 
 		if self.db is None:
 			return False
 		else:
 			return True
 
-	def disconnect(self):
-		""" Méthode pour déconnecter la db """
-		self.db.close()
+	def is_reachable(self, timeout=0.2):
+		""" Vérifie rapidement que le serveur accepte les connexions TCP sur son port, sans s'authentifier
+			Remplace un ping ICMP, souvent filtré et qui demande les droits root. connect() ne l'utilise pas,
+			le délai de connexion du driver suffit
+		"""
+		if self.db_type == "sqlite":
+			return os.path.exists(self.database)
+		# Port par défaut de sqlserver quand il n'est pas précisé
+		port = int(self.port) if self.port != "" else 1433
+		try:
+			with socket.create_connection((self.host, port), timeout=timeout):
+				return True
+		except OSError:
+			return False
 
-	def open(self, auto_connect=True, fetch_type='tuple'):
-		""" Méthode pour créer un curseur """
+	def disconnect(self, close_sqlite=False):
+		""" Méthode pour libérer la connexion à la db
+			Les connexions issues d'un pool y sont remises, celle de sqlite reste ouverte pour le thread
+			close_sqlite : ferme aussi la connexion sqlite (et libère le fichier), fait à la sortie d'un bloc with
+		"""
+		if self.db is None or (self.db_type == "sqlite" and not close_sqlite):
+			return
+		# Les curseurs gardés en cache appartiennent à cette connexion
+		for cursor in self._cursors.values():
+			try:
+				cursor.close()
+			except self._drv.Error:
+				# Curseur déjà invalide (connexion coupée, ...), la connexion est de toute façon libérée
+				pass
+		self._cursors.clear()
+		self.cursor = None
+		if self.db_type == "postgresql":
+			self._get_pool().putconn(self.db)
+		else:
+			# Pour mariadb, mysql et sqlserver (pool ODBC), close() rend la connexion au pool, celle de sqlite est fermée
+			self.db.close()
+		self.db = None
+		if self.db_type in ("postgresql", "mariadb", "mysql"):
+			# Une connexion est libre, on réveille les threads qui attendent ce pool dans _acquire()
+			condition = self._pool_condition()
+			with condition:
+				condition.notify_all()
+
+	def open(self, auto_connect=True, fetch_type='tuple', stream=False, itersize=10000, prepare=None):
+		""" Méthode pour créer un curseur 
+			stream : avec postgresql, crée un curseur côté serveur qui envoie les lignes par paquets de itersize
+			prepare : avec mariadb et mysql, requête pour laquelle un curseur préparé est créé et gardé sur la connexion
+		"""
 		if auto_connect:
 			if not self.connect(): return False
-		# On essaye de fermer le curseur avant d'en recréer un pour si il existe déjà
-		try:
-			self.cursor.close()
-		except:
-			pass
+		# On libère le curseur précédent s'il existe déjà
+		self._release_cursor()
 
 		if fetch_type not in ('tuple', 'list', 'dict', 'with_names'): 
 			raise ValueError("Incorrect fetch_type")
-		# Si postgresql on spécifie un paramètre pour récupérer les titres des colonnes
-		if self.db_type == 'postgresql' and fetch_type in ('dict', 'with_names'):
+		# Les curseurs préparés sont propres à une requête
+		prepare = prepare if self.db_type in ('mysql', 'mariadb') and not stream else None
+		key = fetch_type if prepare is None else (fetch_type, prepare)
+		# On réutilise le curseur de ce fetch_type s'il a déjà été créé sur cette connexion
+		if not stream:
+			self.cursor = self._cursors.get(key)
+			if self.cursor is not None:
+				if self.db_type == 'mysql':
+					# Remise à zéro de l'état du curseur mysql.connector avant sa réutilisation,
+					# sans libérer la requête préparée sur le serveur
+					self.cursor.reset(free=prepare is None)
+				return True
+		if self.db_type == 'postgresql' and self.use_pipeline:
+			row_factory = psycopg.rows.dict_row if fetch_type == 'dict' else psycopg.rows.tuple_row
+			if stream:
+				self.cursor = self.db.cursor(name="dbu_" + str(id(self)), row_factory=row_factory)
+				self.cursor.itersize = itersize
+			else:
+				self.cursor = self.db.cursor(row_factory=row_factory)
+		elif prepare is not None:
+			# La requête est préparée sur le serveur à sa première exécution puis seuls les paramètres sont envoyés
+			self.cursor = self.db.cursor(prepared=True, dictionary=fetch_type == 'dict')
+		elif self.db_type == 'postgresql' and stream:
+			# Curseur nommé, les lignes restent sur le serveur jusqu'à leur lecture
+			if fetch_type == 'dict':
+				self.cursor = self.db.cursor(name="dbu_" + str(id(self)), cursor_factory=psycopg2.extras.RealDictCursor)
+			else:
+				self.cursor = self.db.cursor(name="dbu_" + str(id(self)))
+			self.cursor.itersize = itersize
+		# Pour with_names, les titres sont lus dans cursor.description, un curseur standard suffit
+		elif self.db_type == 'postgresql' and fetch_type == 'dict':
 			self.cursor = self.db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 		elif self.db_type in ('mysql', 'mariadb') and fetch_type == 'dict':
 			self.cursor = self.db.cursor(dictionary=True)
-		elif self.db_type == 'sqlite' and fetch_type in ('dict', 'with_names'):
-			self.db.row_factory = sqlite3.Row
+		elif self.db_type == 'sqlite' and fetch_type == 'dict':
+			# La connexion est gardée ouverte, on change donc la factory du curseur et pas celle de la connexion
 			self.cursor = self.db.cursor()
+			self.cursor.row_factory = sqlite3.Row
 		else:
 			self.cursor = self.db.cursor()
+		if self.db_type == 'sqlserver':
+			# Les paramètres d'un executemany sont envoyés en tableaux plutôt qu'une ligne à la fois
+			self.cursor.fast_executemany = True
+		if not stream:
+			# Nombre de lignes lues à la fois par fetchmany et l'itération du curseur (itersize pour les curseurs côté serveur)
+			self.cursor.arraysize = 1000
+		# Les curseurs côté serveur sont propres à une requête, ils ne sont pas gardés
+		if not stream and self.cursor is not None:
+			self._cursors[key] = self.cursor
 		# Résultat de la création du curseur
 		if self.cursor is not None:
 			return True
 		else:
 			return False
 
+	def _release_cursor(self):
+		""" Libère le curseur courant, il n'est fermé que s'il n'est pas gardé en cache """
+		if self.cursor is None:
+			return
+		if self.cursor not in self._cursors.values():
+			try:
+				self.cursor.close()
+			except self._drv.Error:
+				pass
+		self.cursor = None
+
 	def commit(self):
 		""" Méthode qui met à jour la db """
 		self.db.commit()
 
 	def close(self, commit = False, auto_connect=True):
-		""" Méthode pour détruire le curseur, avec ou sans commit """
+		""" Méthode pour libérer le curseur, avec ou sans commit 
+			Les curseurs en cache restent ouverts jusqu'à disconnect()
+		"""
 		# Si commit demandé à la fermeture
 		if commit:
 			self.db.commit()
-		self.cursor.close()
+		self._release_cursor()
 		if auto_connect:
 			self.disconnect()
+
+	def _abort(self, auto_connect=True):
+		""" Annule la transaction en cours et libère l'accès à la db après une erreur, 
+			pour ne pas garder (ou rendre au pool) une connexion dans une transaction en échec
+		"""
+		if self.db is not None:
+			try:
+				self.db.rollback()
+			except self._drv.Error:
+				# Connexion coupée, le pool l'écartera
+				pass
+		self.close(auto_connect=auto_connect)
 		
-	def execute(self, query, params = None):
-		""" Méthode pour exécuter une requête mais qui gère les drop de curseurs """
+	def execute(self, query, params = None, prepare=False):
+		""" Méthode pour exécuter une requête mais qui gère les drop de curseurs 
+			prepare : avec postgresql, la requête est préparée sur le serveur à sa première exécution sur la connexion
+		"""
 		if self.db_type == "sqlite":
-			query = query.replace("%s", "?")
-			if params is None: params = ()
+			query = _sqlite_rewrite(query)
+			if params is None: params = _EMPTY
+		if prepare and self.db_type == "postgresql":
+			if self.use_pipeline:
+				self.cursor.execute(query, params, prepare=True)
+				return
+			# Les paramètres nommés (%(nom)s) ne peuvent pas être convertis en $1, $2, ...
+			if params is None or isinstance(params, (tuple, list)):
+				self._execute_prepared(query, params)
+				return
 		if params is None:
 			self.cursor.execute(query)
 		else:
 			self.cursor.execute(query, params)
 		
-	def executemany(self, query, params = None):
-		""" Méthode pour exécuter une requête mais qui gère les drop de curseurs """
+	def _execute_prepared(self, query, params):
+		""" Exécute une requête préparée avec psycopg2 (PREPARE une seule fois par connexion puis EXECUTE) 
+			Si la requête ne peut pas être préparée, elle est exécutée normalement
+		"""
+		name, prepare, execute = _pg_prepared(query)
+		prepared = db_unified._prepared.get(self.db)
+		if prepared is None:
+			prepared = db_unified._prepared[self.db] = {}
+		state = prepared.get(name)
+		if state is None:
+			state = prepared[name] = self._prepare(prepare)
+		if not state:
+			if params is None:
+				self.cursor.execute(query)
+			else:
+				self.cursor.execute(query, params)
+			return
+		if params is None:
+			self.cursor.execute(execute)
+		else:
+			self.cursor.execute(execute, params)
+
+	def _prepare(self, prepare):
+		""" Envoie un PREPARE avec psycopg2, renvoie faux s'il est refusé par le serveur
+			(IN %s avec un tuple, paramètre dont le type ne peut pas être déduit, ...)
+			Un savepoint évite que l'échec n'annule la transaction en cours
+		"""
+		savepoint = not self.db.autocommit
+		if savepoint:
+			self.cursor.execute("SAVEPOINT dbu_prepare")
+		try:
+			self.cursor.execute(prepare)
+		except self._drv.Error:
+			if savepoint:
+				self.cursor.execute("ROLLBACK TO SAVEPOINT dbu_prepare")
+			return False
+		if savepoint:
+			self.cursor.execute("RELEASE SAVEPOINT dbu_prepare")
+		return True
+
+	def executemany(self, query, params = None, returning=False, page_size=500):
+		""" Méthode pour exécuter une requête mais qui gère les drop de curseurs 
+			Avec psycopg2, les requêtes sont regroupées par paquets de page_size en un seul envoi au serveur
+		"""
 		if self.db_type == "sqlite":
-			query = query.replace("%s", "?")
-			if params is None: params = ()
-		self.cursor.executemany(query, params)
+			query = _sqlite_rewrite(query)
+			if params is None: params = _EMPTY
+		if self.db_type == "postgresql" and self.use_pipeline:
+			# psycopg envoie toutes les lignes en mode pipeline, returning permet de récupérer les résultats de chacune
+			self.cursor.executemany(query, params, returning=returning)
+		elif self.db_type == "postgresql":
+			# Le executemany de psycopg2 envoie une requête par ligne
+			psycopg2.extras.execute_batch(self.cursor, query, params, page_size=page_size)
+		else:
+			self.cursor.executemany(query, params)
 
-	def exec(self, query, params = None, fetch = "all", auto_connect=True, fetch_type='tuple', insert_many=False):
+	def execute_values(self, query, params, page_size=1000, fetch=False):
+		""" Méthode pour insérer plusieurs lignes avec postgresql en une seule requête INSERT par page de page_size lignes
+			La requête peut contenir un seul %s (VALUES %s) ou un %s par colonne (VALUES (%s, %s)), 
+			dans ce cas le groupe de la ligne est utilisé comme template
+			Les requêtes sans VALUES (UPDATE, DELETE, ...) sont envoyées avec executemany
+			fetch : renvoie les lignes de RETURNING de toutes les pages (le curseur ne garde que celles de la dernière)
+		"""
+		template = None
+		match = _VALUES_ROW.search(query)
+		if match is not None:
+			template = match.group(1)
+			query = query[:match.start(1)] + "%s" + query[match.end(1):]
+		elif _VALUES_SINGLE.search(query) is None:
+			if not fetch:
+				return self.executemany(query, params, page_size=page_size)
+			# execute_batch ne garde que le résultat de la dernière requête, on les exécute donc une à une
+			rows = []
+			for row_params in params:
+				self.cursor.execute(query, row_params)
+				rows += self.cursor.fetchall()
+			return rows
+		return psycopg2.extras.execute_values(self.cursor, query, params, template=template, page_size=page_size, fetch=fetch)
+
+	def _quote_identifier(self, name):
+		""" Met un nom de table ou de colonne (éventuellement préfixé du schéma) entre les délimiteurs du type de db """
+		if self.db_type in ("mariadb", "mysql"):
+			return ".".join("`" + part.replace("`", "``") + "`" for part in name.split("."))
+		if self.db_type == "sqlserver":
+			return ".".join("[" + part.replace("]", "]]") + "]" for part in name.split("."))
+		return ".".join('"' + part.replace('"', '""') + '"' for part in name.split("."))
+
+	def bulk_copy(self, table, columns, rows, auto_connect=True):
+		""" Méthode pour insérer un grand nombre de lignes avec le chargement en masse de la db, sans passer par exec()
+			table : nom de la table, éventuellement préfixé du schéma
+			columns : liste des colonnes à remplir
+			rows : lignes à insérer, dans l'ordre des colonnes
+			Les noms sont mis entre délimiteurs mais ne doivent pas venir d'une saisie utilisateur
+			- postgresql : COPY FROM STDIN (binaire avec pgcopy s'il est installé, CSV sinon)
+			- mariadb et mysql : LOAD DATA LOCAL INFILE depuis un fichier CSV temporaire si local_infile est activé
+			- autres cas : executemany dans une seule transaction
+			Si auto_connect est faux, la connexion doit déjà être ouverte par l'appelant
+			Les lignes sont commitées à la fin
+		"""
+		if not self.open(auto_connect=auto_connect):
+			raise AttributeError("Erreur de création du curseur pour l'accès à la db")
+		try:
+			column_list = ", ".join(self._quote_identifier(column) for column in columns)
+			if self.db_type == "postgresql" and self.use_pipeline:
+				copy_query = psycopg.sql.SQL("COPY {} ({}) FROM STDIN").format(psycopg.sql.Identifier(*table.split(".")), 
+					psycopg.sql.SQL(", ").join(psycopg.sql.Identifier(column) for column in columns))
+				with self.cursor.copy(copy_query) as copy:
+					for row in rows:
+						copy.write_row(row)
+			elif self.db_type == "postgresql" and pgcopy is not None:
+				pgcopy.CopyManager(self.db, table, columns).copy(rows)
+			elif self.db_type == "postgresql":
+				# En CSV, un champ vide sans guillemets est lu comme NULL
+				with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024, mode="w+", newline="") as buffer:
+					for row in rows:
+						buffer.write(",".join(_csv_field(value, "") for value in row) + "\n")
+					buffer.seek(0)
+					self.cursor.copy_expert(f"COPY {self._quote_identifier(table)} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+			elif self.db_type in ("mariadb", "mysql") and self.local_infile:
+				# Avec FIELDS ENCLOSED BY, le mot NULL sans guillemets est lu comme NULL
+				with tempfile.NamedTemporaryFile(mode="w", suffix=".csv", newline="", encoding="utf-8", delete=False) as file:
+					for row in rows:
+						file.write(",".join(_csv_field(value, "NULL") for value in row) + "\n")
+				try:
+					self.cursor.execute(f"LOAD DATA LOCAL INFILE '{file.name.replace(os.sep, '/')}' INTO TABLE {self._quote_identifier(table)} "
+						"CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' ENCLOSED BY '\"' ESCAPED BY '' LINES TERMINATED BY '\\n' "
+						f"({column_list})")
+				finally:
+					os.remove(file.name)
+			else:
+				# pyodbc n'accepte que les ?, les %s de sqlite sont remplacés par execute()
+				placeholders = ", ".join(["?" if self.db_type == "sqlserver" else "%s"] * len(columns))
+				self.executemany(f"INSERT INTO {self._quote_identifier(table)} ({column_list}) VALUES ({placeholders})", list(rows))
+			self.close(commit=True, auto_connect=auto_connect)
+		except BaseException:
+			self._abort(auto_connect=auto_connect)
+			raise
+
+	def exec(self, query, params = None, fetch = "all", auto_connect=True, fetch_type='tuple', insert_many=False, page_size=1000, stream=False, itersize=10000, auto_limit=False, 
+		prepare=False):
 		""" Méthode pour exécuter une requête et qui ouvre et ferme  la db automatiquement 
 			fetch : quantité de renvoi des données
 				valeurs possibles:
@@ -226,75 +812,293 @@ class db_unified:
 				- list
 				- dict (renvoie une liste de dictionnaires selon la structure {nom de la colonne: valeur})
 				- with_names (renvoie une liste à deux éléments, le premier est la liste des titres et le 2e est la liste des données)
+				- arrow (renvoie une table pyarrow construite directement par le driver, sans passer par des tuples python,
+					uniquement avec fetch = "all", voir read_arrow pour les drivers utilisés)
 			insert_many : ajout de plusieurs lignes dans la db
 				valeurs possibles : vrai ou faux
 				si vrai, il faut passer un tuple à deux niveaux
 				Il doit y avoir autant de %s dans la requête (VALUES) que le nombre de colonnes à insérer
+				Avec postgresql, on peut aussi mettre un seul %s (VALUES %s), les lignes sont envoyées par pages de page_size
+			page_size : nombre de lignes envoyées par requête INSERT avec insert_many sur postgresql
+			stream : lecture des lignes au fur et à mesure plutôt que de tout charger en mémoire (requêtes de lecture uniquement)
+				avec fetch = "all", renvoie un générateur de lignes, l'accès à la db est fermé une fois le générateur parcouru
+				avec fetch = "list", la liste est construite en parcourant le curseur
+				avec postgresql, un curseur côté serveur est utilisé : le générateur doit être parcouru avant toute 
+				autre requête sur cette instance car le curseur n'existe que dans la transaction en cours
+			itersize : nombre de lignes récupérées à la fois par le curseur côté serveur avec stream
+			auto_limit : avec fetch = "one" ou "single", ajoute LIMIT 1 (TOP 1 pour sqlserver) aux SELECT qui n'ont pas de limite 
+				pour que le serveur s'arrête à la première ligne
+			prepare : prépare la requête sur le serveur à sa première exécution, les suivantes n'envoient que les paramètres
+				(à réserver aux requêtes exécutées souvent, sans insert_many ni stream)
+				avec postgresql, la requête préparée reste sur la connexion du pool (psycopg2 : paramètres %s uniquement)
+				avec mariadb et mysql, uniquement avec auto_connect=False : un curseur préparé par requête est gardé jusqu'au 
+				disconnect() (avec auto_connect, chaque exec() se termine par disconnect() qui fermerait le curseur préparé)
+				sqlserver et sqlite gardent déjà en cache les requêtes des curseurs et connexions réutilisés
 		"""
 		# Si fetch_type incorrect
 		if fetch_type == "dict_name":
 			# Compatibilité suite au changement du nom de fetch_type
 			fetch_type = "with_names"
-		# Détermination du commit
-		if not "SELECT" in query.upper()[:20] and not "SHOW" in query.upper()[:20]:
-			commit = True
-		else:
-			commit = False
+		if fetch_type == "arrow":
+			return self.read_arrow(query, params, fetch)
+		# Détermination du commit, seul le début de la requête est analysé
+		commit, returning, select = _query_kind(query)
+		if auto_limit and fetch in ("one", "single") and select:
+			query = _with_limit(query, 1, self.db_type)
+		# Les curseurs côté serveur ne permettent que la lecture
+		stream = stream and select
+		if stream and fetch_type == "with_names":
+			raise ValueError("fetch_type 'with_names' is not available with stream")
+		prepare = prepare and not stream and not insert_many
+		run, read = self._exec_steps(fetch, fetch_type, insert_many)
 		# Ouverture de l'accès à la db
-		if self.open(auto_connect=auto_connect, fetch_type=fetch_type):
-			if insert_many and self.db_type in ("postgresql", "mariadb"):
-				self.executemany(query, params)
-			else:
-				self.execute(query, params)
-			# Si pas de commit ce sera une récupération
-			if not commit or "RETURNING" in query.upper():	
-				# S'il faut récupérer les titres
-				if fetch_type == "with_names":
-					fetch_title = True
-				else:
-					fetch_title = False
-				# Type de récupération des données
-				if fetch == "all":
-					value = self.fetchall()
-					if fetch_title:
-						value = self.extract_title(value, fetch)
-				elif fetch == "one":
-					value = self.fetchone()
-					if fetch_title:
-						value = self.extract_title(value, fetch)
-					# On vide le curseur pour éviter l'erreur de data restantes à la fermeture
-					trash = self.fetchall()
-				elif fetch == "single":
+		# Les curseurs préparés mariadb et mysql ne survivent pas au disconnect() fait par auto_connect
+		prepare_cursor = query if prepare and not auto_connect else None
+		if not self.open(auto_connect=auto_connect, fetch_type=fetch_type, stream=stream, itersize=itersize, prepare=prepare_cursor):
+			raise AttributeError("Erreur de création du curseur pour l'accès à la db")
+		try:
+			if self.db_type == "sqlserver" and auto_connect and self.db.autocommit != (not commit):
+				# Les lectures se font en autocommit, sans transaction implicite à valider, 
+				# les modifications restent dans une transaction validée à la fermeture
+				self.db.autocommit = not commit
+			rows = run(query, params, page_size, returning, prepare)
+			if fetch == "all" and stream:
+				# La fermeture de l'accès à la db est faite par le générateur
+				return self.stream_rows(auto_connect=auto_connect, fetch_type=fetch_type)
+			# Le curseur indique si la requête a renvoyé des données (SELECT, RETURNING, procédure, ...),
+			# la description d'un curseur côté serveur psycopg2 n'est connue qu'après la première lecture
+			value = None
+			if rows is not None or stream or self.cursor.description is not None:
+				value = read(rows)
+			self.close(auto_connect=auto_connect, commit=commit)
+		except BaseException:
+			# En cas d'erreur, la transaction est annulée et la connexion libérée avant de remonter l'erreur
+			self._abort(auto_connect=auto_connect)
+			raise
+		return value
+
+	def exec_many(self, query, seq_of_params, fetch = None, auto_connect=True, page_size=1000):
+		""" Méthode pour exécuter une même requête avec une liste de paramètres, en lots plutôt qu'une ligne à la fois
+			Équivalent de exec() avec insert_many : execute_values ou execute_batch pour postgresql, 
+			fast_executemany pour sqlserver et executemany pour les autres
+		"""
+		return self.exec(query, seq_of_params, fetch=fetch, auto_connect=auto_connect, insert_many=True, page_size=page_size)
+
+	def stream(self, query, params = None, fetch_type='tuple', auto_connect=True, itersize=2000):
+		""" Méthode qui renvoie un générateur sur les lignes d'un SELECT sans charger tout le résultat en mémoire
+			Avec postgresql, les lignes sont lues par paquets de itersize sur un curseur côté serveur
+			Équivalent de exec() avec stream, voir ses restrictions
+		"""
+		return self.exec(query, params, fetch="all", auto_connect=auto_connect, fetch_type=fetch_type, stream=True, itersize=itersize)
+
+	def _exec_steps(self, fetch, fetch_type, insert_many):
+		""" Renvoie les fonctions d'exécution et de lecture correspondant aux paramètres de exec()
+			Elles ne contiennent que la branche utile et sont construites une seule fois par combinaison
+		"""
+		key = (fetch, fetch_type, insert_many)
+		steps = self._exec_cache.get(key)
+		if steps is None:
+			steps = (self._build_run(insert_many), self._build_read(fetch, fetch_type))
+			self._exec_cache[key] = steps
+		return steps
+
+	def _build_run(self, insert_many):
+		""" Construit la fonction d'exécution de la requête : run(query, params, page_size, returning, prepare) 
+			Elle renvoie les lignes déjà récupérées (RETURNING d'un insert_many par pages avec psycopg2) ou None
+		"""
+		if not insert_many:
+			return lambda query, params, page_size, returning, prepare: self.execute(query, params, prepare=prepare)
+		if self.db_type == "postgresql" and self.use_pipeline:
+			return lambda query, params, page_size, returning, prepare: self.executemany(query, params, returning=returning)
+		if self.db_type == "postgresql":
+			return lambda query, params, page_size, returning, prepare: self.execute_values(query, params, page_size=page_size, fetch=returning)
+		# Pas d'autocommit sur ces connexions, toutes les lignes sont donc insérées dans une seule transaction
+		return lambda query, params, page_size, returning, prepare: self.executemany(query, params)
+
+	def _build_read(self, fetch, fetch_type):
+		""" Construit la fonction de récupération des données : read(rows)
+			rows : lignes déjà récupérées par run(), None pour les lire sur le curseur
+		"""
+		# S'il faut récupérer les titres
+		fetch_title = fetch_type == "with_names"
+		# Si fetch_type == 'list' on transforme les tuples en listes
+		to_list = fetch_type == "list"
+
+		if fetch == "all":
+			if fetch_title:
+				return lambda rows: self.extract_title(self.fetchall() if rows is None else rows, fetch)
+			if to_list:
+				return lambda rows: [list(item) for item in (self.fetchall() if rows is None else rows)]
+			return lambda rows: self.fetchall() if rows is None else rows
+
+		elif fetch in ("one", "single"):
+			def read(rows):
+				if rows is None:
 					value = self.fetchone()
-					if fetch_title:
-						value = self.extract_title(value, fetch)
-					elif value is not None:
-						value = value[0]
-					# On vide le curseur pour éviter l'erreur de data restantes à la fermeture
-					trash = self.fetchall()
-				elif fetch == 'list':
-					# On renvoie une liste composée du premier élément de chaque ligne
-					value = [item[0] for item in self.fetchall()]
-				elif fetch == None:
-					# Si pas de données à récupérer
-					value = None
 				else:
-					raise ValueError("Wrong fetch type")
-				self.close(auto_connect=auto_connect, commit=commit)
-				# Si fetch_type == 'list' on transforme le tuple en liste
-				if fetch_type == "list":
-					if fetch == "all":
-						value = [list(item) for item in value]
-					elif fetch in ("one", "single") and value is not None:
-						value = list(value)
+					value = rows[0] if rows else None
+				if fetch_title:
+					value = self.extract_title(value, fetch)
+				elif fetch == "single" and value is not None:
+					value = value[0]
+				elif to_list and value is not None:
+					value = list(value)
+				self.close_unread()
 				return value
+			return read
+
+		elif fetch == 'list':
+			# On renvoie une liste composée du premier élément de chaque ligne
+			if self.db_type == "postgresql" and self.use_pipeline:
+				# Les résultats d'un executemany avec returning sont répartis sur plusieurs sets, lus par fetchall
+				return lambda rows: [item[0] for item in (self.fetchall() if rows is None else rows)]
+			# Les lignes sont lues par paquets (arraysize) en parcourant le curseur, sans liste intermédiaire
+			return lambda rows: [item[0] for item in (self.cursor if rows is None else rows)]
+
+		elif fetch == None:
+			# Si pas de données à récupérer
+			return lambda rows: None
+
+		def read(rows):
+			raise ValueError("Wrong fetch type")
+		return read
+
+	def read_arrow(self, query, params = None, fetch = "all"):
+		""" Méthode pour récupérer le résultat d'une requête sous forme de table pyarrow (colonnes contiguës) 
+			La requête est exécutée sur sa propre connexion, les None sont gardés (nulls arrow), par :
+				- adbc_driver_postgresql pour postgresql s'il est installé ('pip install adbc-driver-postgresql pyarrow')
+				- turbodbc pour sqlserver s'il est installé ('pip install turbodbc pyarrow')
+				- connectorx sinon, sans paramètres ('pip install connectorx pyarrow')
+		"""
+		if fetch != "all":
+			raise ValueError("fetch_type 'arrow' is only available with fetch 'all'")
+		if self.db_type == "postgresql":
+			try:
+				import adbc_driver_postgresql.dbapi
+			except ImportError:
+				pass
 			else:
-				self.close(auto_connect=auto_connect, commit=commit)
-		else:
+				# Le protocole binaire de postgresql est décodé directement dans les colonnes arrow
+				with adbc_driver_postgresql.dbapi.connect(self._arrow_uri()) as conn, conn.cursor() as cursor:
+					if params is None:
+						cursor.execute(query)
+					else:
+						cursor.execute(_pg_numbered(query)[0], params)
+					return cursor.fetch_arrow_table()
+		elif self.db_type == "sqlserver":
+			try:
+				import turbodbc
+			except ImportError:
+				pass
+			else:
+				conn = turbodbc.connect(connection_string=self._odbc_dsn)
+				try:
+					cursor = conn.cursor()
+					if params is None:
+						cursor.execute(query)
+					else:
+						cursor.execute(_sqlite_rewrite(query), params)
+					return cursor.fetchallarrow()
+				finally:
+					conn.close()
+		if params is not None:
+			raise ValueError("fetch_type 'arrow' does not support query parameters with connectorx")
+		try:
+			import connectorx
+		except ImportError:
+			raise ImportError("fetch_type 'arrow' nécessite connectorx, installer avec 'pip install connectorx pyarrow'")
+		return connectorx.read_sql(self._arrow_uri(), query, return_type="arrow")
+
+	def _arrow_uri(self):
+		""" Construit l'URI de connexion utilisée par connectorx et adbc 
+			Pour postgresql, les options (search_path, ...) et le délai de connexion sont les mêmes que ceux du pool
+		"""
+		if self.db_type == "sqlite":
+			return "sqlite://" + os.path.abspath(self.database)
+		scheme = {"postgresql": "postgresql", "mariadb": "mysql", "mysql": "mysql", "sqlserver": "mssql"}[self.db_type]
+		uri = f"{scheme}://{quote(str(self.user), safe='')}:{quote(str(self.password or ''), safe='')}@{self.host}"
+		if self.port != "":
+			uri += f":{self.port}"
+		uri += "/" + quote(str(self.database), safe='')
+		if self.db_type == "postgresql":
+			query = {"connect_timeout": self.connect_timeout}
+			if self.sslmode != "allow":
+				query["sslmode"] = self.sslmode
+			if self.options:
+				query["options"] = self.options
+			uri += "?" + urlencode(query, quote_via=quote)
+		elif self.db_type == "sqlserver":
+			uri += "?trust_server_certificate=true"
+		return uri
+
+	def stream_rows(self, auto_connect=True, fetch_type='tuple'):
+		""" Générateur qui renvoie les lignes du curseur une à une et ferme l'accès à la db une fois parcouru """
+		try:
+			for row in self.cursor:
+				yield list(row) if fetch_type == "list" else row
+		except BaseException:
+			# Erreur de lecture ou générateur abandonné avant la fin
+			self._abort(auto_connect=auto_connect)
+			raise
+		self.close(auto_connect=auto_connect)
+
+	def exec_pipeline(self, queries, auto_connect=True):
+		""" Méthode pour exécuter une liste de requêtes dans une seule transaction
+			queries : liste de tuples (requête, paramètres)
+			Renvoie la liste des résultats de chaque requête (None pour celles qui ne renvoient pas de données)
+			Avec postgresql et use_pipeline, les requêtes sont envoyées à la suite sans attendre la réponse de chacune,
+			sinon elles sont exécutées une à une
+		"""
+		if not self.open(auto_connect=auto_connect):
 			raise AttributeError("Erreur de création du curseur pour l'accès à la db")
+		results = []
+		try:
+			if self.db_type == "postgresql" and self.use_pipeline:
+				# Un curseur par requête pour garder le résultat de chacune
+				with self.db.pipeline():
+					cursors = [self.db.execute(query, params) for query, params in queries]
+				for cursor in cursors:
+					results.append(cursor.fetchall() if cursor.description is not None else None)
+					cursor.close()
+			else:
+				for query, params in queries:
+					self.execute(query, params)
+					results.append(self.fetchall() if self.cursor.description is not None else None)
+			self.close(auto_connect=auto_connect, commit=True)
+		except BaseException:
+			# Aucune des requêtes n'est gardée si l'une d'elles échoue
+			self._abort(auto_connect=auto_connect)
+			raise
+		return results
+
+	def close_unread(self):
+		""" Ferme le curseur sans récupérer les lignes restantes du résultat 
+			Un curseur préparé (mariadb, mysql) est vidé et gardé en cache, pour ne pas refaire la préparation
+		"""
+		for key, cursor in list(self._cursors.items()):
+			if cursor is self.cursor:
+				if isinstance(key, tuple):
+					# Les curseurs préparés sont indexés par (fetch_type, requête), avec auto_limit il ne reste rien à lire
+					self.fetchall()
+					self.cursor = None
+					return
+				# Le curseur n'est plus réutilisable, on le retire du cache
+				del self._cursors[key]
+		if self.db_type == "mysql":
+			# mysql.connector refuse de fermer un curseur qui a encore des données non lues,
+			# avec auto_limit il ne reste aucune ligne à lire
+			self.fetchall()
+		self.cursor.close()
+		self.cursor = None
 
 	def fetchall(self):
 		""" Méthode pour le fetchall """
+		if self.db_type == "postgresql" and self.use_pipeline:
+			# Après un executemany avec returning, chaque ligne insérée a son propre résultat
+			rows = self.cursor.fetchall()
+			while self.cursor.nextset():
+				rows += self.cursor.fetchall()
+			return rows
 		return self.cursor.fetchall()
 
 	def fetchone(self):
@@ -303,46 +1107,32 @@ class db_unified:
 
 	def replace_none_list(self, liste):
 		""" Remplacer les None contenus dans la liste par une string vide """
-		# On regarde si c'est une liste à un ou deux niveaux
-		level = 1
-		if type(liste[0]) == list:
-			level = 2
-
-		for seq, item in enumerate(liste):
-			if level == 1:
-				if item == None:
-					liste[seq] = ""
-			elif level == 2:
-				for sub_seq, sub_item in enumerate(item):
-					if sub_item == None:
-						liste[seq][sub_seq] = ""
-
-		return liste
+		if not liste: return liste
+		# Liste à deux niveaux : on reconstruit chaque ligne d'un coup au lieu de tester les cellules une par une
+		if isinstance(liste[0], list):
+			return [["" if item is None else item for item in row] for row in liste]
+		return ["" if item is None else item for item in liste]
 
 	def extract_title(self, value, fetch):
 		""" On extrait les titres du résultat et on renvoie le bon type de donnée en fonction du fetch 
 			on renvoie une liste dont le premier élément sera une liste avec les titres des colonnes
-			et le 2e élément sera une liste avec les données
+			et le 2e élément sera une liste avec les données (les None sont remplacés par une string vide)
 
-			postgresql renvoie une liste de dictionnaires
+			Les titres sont lus dans la description du curseur, identique pour tous les drivers
 		"""
 		
 		# Si aucune donnée, on renvoie une liste vide
 		if value == []: return []
+		if value is None: return None
 
-		if self.db_type == 'postgresql':
-			if fetch == 'all':
-				result = [list(value[0].keys()), self.replace_none_list([list(row.values()) for row in value])]
-			elif fetch == "one":
-				result = [list(value.keys()), self.replace_none_list(list(value.values()))]
-			elif fetch == "single":
-				result = [list(value.keys())[0], self.replace_none_list(list(value.values()))[0]]
-		
-		elif self.db_type in ('mysql', 'mariadb'):
-			result = [[i[0] for i in self.cursor.description], self.replace_none_list([row for row in value])]
-
-
-		return result
+		titles = [column[0] for column in self.cursor.description]
+		if fetch == 'all':
+			# Les None sont remplacés pendant la copie de chaque ligne en liste
+			return [titles, [["" if item is None else item for item in row] for row in value]]
+		elif fetch == "one":
+			return [titles, self.replace_none_list(list(value))]
+		elif fetch == "single":
+			return [titles[0], "" if value[0] is None else value[0]]
 
 	def __enter__(self):
 		""" Ouverture avec with """
@@ -350,11 +1140,12 @@ class db_unified:
 		return self
 
 	def __exit__(self, *args, **kwargs):
-		""" Fermeture avec with """
-		self.disconnect()
+		""" Fermeture avec with, la connexion est rendue au pool (ou fermée pour sqlite) """
+		self.disconnect(close_sqlite=True)
 
+	@staticmethod
 	def handle_datetimeoffset(dto_value):
+	    """ Convertisseur pyodbc des DATETIMEOFFSET en texte, appelé pour chaque valeur de ce type """
 	    # ref: https://github.com/mkleehammer/pyodbc/issues/134#issuecomment-281739794
-	    tup = struct.unpack("<6hI2h", dto_value)  # e.g., (2017, 3, 16, 10, 35, 18, 0, -6, 0)
-	    tweaked = [tup[i] // 100 if i == 6 else tup[i] for i in range(len(tup))]
-	    return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}.{:07d} {:+03d}:{:02d}".format(*tweaked)
\ No newline at end of file
+	    year, month, day, hour, minute, second, nanosecond, tz_hour, tz_minute = _DTO.unpack(dto_value)  # e.g., (2017, 3, 16, 10, 35, 18, 0, -6, 0)
+	    return f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}:{second:02d}.{nanosecond // 100:07d} {tz_hour:+03d}:{tz_minute:02d}"
\ No newline at end of file